@@ -1,10 +1,55 @@
 #!/usr/bin/env python3
 
 import re
-from collections import Counter
-
 import sys
-print(sys.version)
+from functools import lru_cache
+
+# words may contain apostrophes (eg. "what'sup"), but quotes around them are dropped
+TOKEN_RE = re.compile(r"\w+(?:'\w+)*")
+# key of the tags in a phrase trie; never a word, since words are non-empty
+TRIE_TAGS = ''
+
+def count_tags(words, trie, num_tags):
+    """Count the tags of the phrases in a list of words.
+    Phrases are matched from left to right, taking the longest phrase that
+    starts at each word.
+    Arguments:
+        words (List[str]): The lowercased words of the message.
+        trie (Dict[str, dict]): The phrases to look for, from
+            `ChatBot._build_tag_trie`.
+        num_tags (int): The number of distinct tag IDs.
+    Returns:
+        List[int]: A count of each tag found in the words, by tag ID.
+    """
+    counter = [0] * num_tags
+    i = 0
+    while i < len(words):
+        # follow the trie as far as the words allow, remembering the
+        # longest phrase that ends along the way
+        node = trie
+        tags = None
+        length = 1
+        j = i
+        while j < len(words) and words[j] in node:
+            node = node[words[j]]
+            j += 1
+            if TRIE_TAGS in node:
+                tags = node[TRIE_TAGS]
+                length = j - i
+        if tags is not None:
+            for tag_id in tags:
+                counter[tag_id] += 1
+        i += length
+    return counter
+
+# the pure Python version is kept to check the compiled one against
+_count_tags_py = count_tags
+
+try:
+    # compiled version of count_tags, if it has been built; see tagscan.pyx
+    from tagscan import count_tags
+except ImportError:
+    pass
 
 class ChatBot:
     """A tag-based chatbot framework
@@ -24,21 +69,45 @@ class ChatBot:
         `on_enter_confirm_delete` might return "Are you sure you want to
         delete?".
     * `respond_from_*()` determines which state the chatbot should enter next.
-        It takes two arguments: a string `message`, and a dictionary `tags`
-        which counts the number of times each tag appears in the message. This
-        function should always return with calls to either `go_to_state` or
-        `finish`.
+        It takes two arguments: a string `message`, and a frozenset `tags` of
+        the tags that appear in the message. This function should always
+        return with calls to either `go_to_state` or `finish`.
     The `go_to_state` method automatically calls the related `on_enter_*`
     method before setting the state of the chatbot. The `finish` function calls
-    a `finish_*` function before setting the state of the chatbot to the
-    default state.
+    a `finish_*` function, or if there is none, uses the response in the
+    FINISH_RESPONSES class variable, a dictionary from manners to constant
+    responses, before setting the state of the chatbot to the default state.
+    A `finish_*` method always takes priority, so a subclass can override an
+    inherited FINISH_RESPONSES entry by defining one.
     The TAGS class variable is a dictionary whose keys are words/phrases and
     whose values are (list of) tags for that word/phrase. If the words/phrases
     match a message, these tags are provided to the `respond_from_*` methods.
+    Phrases are matched on whole words from left to right, and where phrases
+    overlap only the longest one counts; for example, "of course not" only
+    matches "of course not" and not also "of course".
+    The optional REQUIRED_TAGS class variable is a dictionary from states to
+    the tags that their `respond_from_*` method reads. Messages in those
+    states are only matched against the phrases needed to find those tags;
+    other states are matched against all of TAGS.
+    TAGS is compiled when the chatbot class is defined, and should not be
+    modified afterwards.
     """
 
+    __slots__ = (
+        'default_state', 'tags',
+        '_state_names', '_state_ids', '_default_sid', '_sid',
+        '_on_enter', '_respond_from', '_finish',
+    )
+
     STATES = []
     TAGS = {}
+    REQUIRED_TAGS = {}
+    FINISH_RESPONSES = {}
+
+    def __init_subclass__(cls, **kwargs):
+        """Compile the TAGS of a chatbot once, when its class is defined."""
+        super().__init_subclass__(**kwargs)
+        cls._check_tags()
 
     def __init__(self, default_state):
         """Initialize a Chatbot.
@@ -52,55 +121,175 @@ class ChatBot:
                 'Perhaps you mean ' + str(self.STATES[0]) + '?',
             ]))
         self.default_state = default_state
-        self.state = self.default_state
+        # states are tracked by their index in STATES; `state` maps back to the name
+        self._state_names = tuple(self.STATES)
+        if default_state not in self._state_names:
+            self._state_names += (default_state,)
+        self._state_ids = {state: sid for sid, state in enumerate(self._state_names)}
+        self._default_sid = self._state_ids[default_state]
+        self._sid = self._default_sid
         self.tags = {}
         self._check_states()
-        self._check_tags()
+
+    @property
+    def state(self):
+        """str: The current state of the chatbot."""
+        return self._state_names[self._sid]
+
+    @state.setter
+    def state(self, state):
+        self._sid = self._state_ids[state]
 
     def _check_states(self):
-        """Check the STATES to make sure that relevant functions are defined."""
-        for state in self.STATES:
+        """Check the STATES to make sure that relevant functions are defined.
+        This also looks up the `on_enter_*`, `respond_from_*`, and `finish_*`
+        methods. The state methods are stored in lists indexed by state ID,
+        with a stand-in that raises AttributeError for any method that is not
+        defined. The finish responses map each manner to either a `finish_*`
+        method or, if there is none, its constant from FINISH_RESPONSES.
+        """
+        members = frozenset(dir(self))
+        self._on_enter = []
+        self._respond_from = []
+        for sid, state in enumerate(self._state_names):
             prefixes = []
-            if state != self.default_state:
+            if sid != self._default_sid:
                 prefixes.append('on_enter')
             prefixes.append('respond_from')
+            methods = {
+                'on_enter': self._missing_method('on_enter_' + state),
+                'respond_from': self._missing_method('respond_from_' + state),
+            }
             for prefix in prefixes:
-                if not hasattr(self, prefix + '_' + state):
+                if prefix + '_' + state in members:
+                    methods[prefix] = getattr(self, prefix + '_' + state)
+                else:
                     print(' '.join([
                         'WARNING:',
                         'State "' + str(state) + '" is defined',
                         'but has no response function self.' + str(prefix) + '_' + str(state),
                     ]))
+            self._on_enter.append(methods['on_enter'])
+            self._respond_from.append(methods['respond_from'])
+        self._finish = dict(self.FINISH_RESPONSES)
+        for name in members:
+            if name.startswith('finish_'):
+                self._finish[name[len('finish_'):]] = getattr(self, name)
+
+    def _missing_method(self, name):
+        """Make a stand-in for a state method that is not defined.
+        Arguments:
+            name (str): The name of the missing method.
+        Returns:
+            Callable: A function that raises AttributeError when called.
+        """
+        def missing(*args):
+            raise AttributeError("'" + self.__class__.__name__ + "' object has no attribute '" + name + "'")
+        return missing
 
-    def _check_tags(self):
+    @classmethod
+    def _check_tags(cls):
         """Check the TAGS to make sure that it has the correct format."""
-        for phrase in self.TAGS:
-            tags = self.TAGS[phrase]
+        merged = {}
+        for phrase, tags in cls.TAGS.items():
             if isinstance(tags, str):
-                self.TAGS[phrase] = [tags]
-            tags = self.TAGS[phrase]
+                tags = [tags]
             assert isinstance(tags, (tuple, list)), ' '.join([
                 'ERROR:',
                 'Expected tags for {phrase} to be str or List[str]',
                 'but got ' + tags.__class__.__name__,
             ])
+            # phrases are matched word by word, so eg. 'Hello' and 'hello',
+            # or 'whats up' and 'whats up?', are the same phrase
+            phrase = ' '.join(TOKEN_RE.findall(phrase.lower()))
+            merged.setdefault(phrase, []).extend(tags)
+        cls.TAGS = {phrase: list(dict.fromkeys(tags)) for phrase, tags in merged.items()}
+        # tags are counted by integer ID, in alphabetical order of their names
+        cls._tag_names = tuple(sorted(set(tag for tags in cls.TAGS.values() for tag in tags)))
+        cls._no_tags = ((0,) * len(cls._tag_names), frozenset())
+        # states in REQUIRED_TAGS get their own phrase trie; the rest use all of TAGS
+        all_trie = cls._build_tag_trie(cls.TAGS)
+        state_tries = {
+            state: cls._build_tag_trie(cls._relevant_tags(required))
+            for state, required in cls.REQUIRED_TAGS.items()
+        }
+
+        # repeated messages (eg. "yes", "no") skip the scan entirely; the
+        # cache is shared by every instance of the class
+        @lru_cache(maxsize=256)
+        def find_tags(msg, state):
+            return cls._scan_tags(msg, state_tries.get(state, all_trie))
+
+        cls._find_tags = staticmethod(find_tags)
+
+    @classmethod
+    def _relevant_tags(cls, required):
+        """Select the part of TAGS needed to find some tags.
+        Besides the phrases with the required tags, this includes any phrase
+        that could overlap with them in a message (ie. that shares a word with
+        them), since that can change which of the two matches.
+        Arguments:
+            required (List[str]): The tags to look for.
+        Returns:
+            Dict[str, List[str]]: The phrases and tags to match against.
+        """
+        phrases = set(phrase for phrase, tags in cls.TAGS.items() if set(required).intersection(tags))
+        words = set(word for phrase in phrases for word in phrase.split())
+        changed = True
+        while changed:
+            changed = False
+            for phrase in cls.TAGS:
+                if phrase not in phrases and words.intersection(phrase.split()):
+                    phrases.add(phrase)
+                    words.update(phrase.split())
+                    changed = True
+        return {phrase: tags for phrase, tags in cls.TAGS.items() if phrase in phrases}
+
+    @classmethod
+    def _build_tag_trie(cls, tags_by_phrase):
+        """Index phrases for `_scan_tags`.
+        The trie is a nested dictionary keyed by word, so phrases that start
+        with the same words (eg. "of course" and "of course not") share a
+        path. A node that ends a phrase stores the IDs of its tags under
+        TRIE_TAGS.
+        Arguments:
+            tags_by_phrase (Dict[str, List[str]]): The phrases and their tags.
+        Returns:
+            Dict[str, dict]: The root of the trie.
+        """
+        tag_ids = {tag: tag_id for tag_id, tag in enumerate(cls._tag_names)}
+        trie = {}
+        for phrase, tags in tags_by_phrase.items():
+            words = phrase.split()
+            if not words:
+                continue
+            node = trie
+            for word in words:
+                node = node.setdefault(word, {})
+            node[TRIE_TAGS] = tuple(tag_ids[tag] for tag in tags)
+        return trie
 
     def go_to_state(self, state):
         """Set the chatbot's state after responding appropriately.
         Arguments:
-            state (str): The state to go to.
+            state (str or int): The state (or state ID) to go to.
         Returns:
             str: The response of the chatbot.
         """
-        assert state in self.STATES, 'ERROR: state "' + str(state) + ' is not defined'
-        assert state != self.default_state, ' '.join([
-            'WARNING:',
-            "do not call `go_to_state` on the default state " + self.default_state + ";",
-            'use `finish` instead',
-        ])
-        on_enter_method = getattr(self, 'on_enter_' + state)
-        response = on_enter_method()
-        self.state = state
+        if isinstance(state, int) and not isinstance(state, bool) and 0 <= state < len(self._state_names):
+            sid = state
+        elif state in self._state_ids:
+            sid = self._state_ids[state]
+        else:
+            raise KeyError('ERROR: state "' + str(state) + '" is not defined')
+        if sid == self._default_sid:
+            raise ValueError(' '.join([
+                'ERROR:',
+                "do not call `go_to_state` on the default state " + self.default_state + ";",
+                'use `finish` instead',
+            ]))
+        response = self._on_enter[sid]()
+        self._sid = sid
         return response
 
     def chat(self):
@@ -108,12 +297,11 @@ class ChatBot:
         try:
             message = input('> ')
             while message.lower() not in ('exit', 'quit'):
-                print()
                 response = self.respond(message)
                 if response is None:
                     print('WARNING: response from state ' + self.state + ' returned None')
-                print(self.__class__.__name__ + ': ' + str(response))
-                print()
+                # a single write per turn; input() flushes it before prompting
+                sys.stdout.write('\n' + self.__class__.__name__ + ': ' + str(response) + '\n\n')
                 message = input('> ')
         except (EOFError, KeyboardInterrupt):
             print()
@@ -126,37 +314,62 @@ class ChatBot:
         Returns:
             str: The response of the chatbot.
         """
-        respond_method = getattr(self, 'respond_from_' + self.state)
-        return respond_method(message, self._get_tags(message))
+        _, tags = self._get_tags(message)
+        return self._respond_from[self._sid](message, tags)
 
     def finish(self, manner):
         """Set the chatbot back to the default state
-        This function will call the appropriate `finish_*` method.
+        This function will call the appropriate `finish_*` method, or use the
+        response in FINISH_RESPONSES if there is none.
         Arguments:
             manner (str): The type of exit from the flow.
         Returns:
             str: The response of the chatbot.
         """
-        response = getattr(self, 'finish_' + manner)()
-        self.state = self.default_state
+        if manner not in self._finish:
+            raise AttributeError("'" + self.__class__.__name__ + "' object has no attribute 'finish_" + str(manner) + "'")
+        response = self._finish[manner]
+        if not isinstance(response, str):
+            response = response()
+        self._sid = self._default_sid
         return response
 
     def _get_tags(self, message):
         """Find all tagged words/phrases in a message.
+        If the current state is in REQUIRED_TAGS, only the phrases relevant
+        to it are searched for.
         Arguments:
             message (str): The message from the user.
         Returns:
-            Dict[str, int]: A count of each tag found in the message.
+            Tuple[int]: A count of each tag found in the message, indexed by
+                tag ID (the position of the tag in `_tag_names`).
+            FrozenSet[str]: The tags found in the message.
+        Both results are shared with the tag cache and must not be modified.
         """
-        counter = Counter()
         msg = message.lower()
-        for phrase, tags in self.TAGS.items():
-            if re.search(r'\b' + phrase.lower() + r'\b', msg):
-                counter.update(tags)
-        return counter
+        if not msg.strip():
+            return self._no_tags
+        return self._find_tags(msg, self.state)
+
+    @classmethod
+    def _scan_tags(cls, msg, trie):
+        """Scan a message for tagged words/phrases.
+        The result is immutable so that it can be cached by `_find_tags`.
+        Arguments:
+            msg (str): The lowercased message from the user.
+            trie (Dict[str, dict]): The phrases to look for, from
+                `_build_tag_trie`.
+        Returns:
+            Tuple[int]: A count of each tag found in the message, by tag ID.
+            FrozenSet[str]: The tags found in the message.
+        """
+        counter = count_tags(TOKEN_RE.findall(msg), trie, len(cls._tag_names))
+        return tuple(counter), frozenset(tag for tag, count in zip(cls._tag_names, counter) if count)
 
 class oxycsbot(ChatBot):
 
+    __slots__ = ('benefits',)
+
     STATES = [
         'waiting',
         'thoughts_1',
@@ -179,7 +392,7 @@ class oxycsbot(ChatBot):
 
         # generic
         'thanks': 'thanks',
-        'okay': 'success',
+        'okay': ['success', 'yes'],
         'bye': 'success',
         'yes':'yes',
         'yep':'yes',
@@ -188,9 +401,7 @@ class oxycsbot(ChatBot):
 
         #positive tags
         'ok':'yes',
-        'okay':'yes',
         'sounds good':'yes',
-        'yes':'yes',
         'all right':'yes',
         'very well':'yes',
         'of course':'yes',
@@ -204,8 +415,6 @@ class oxycsbot(ChatBot):
         'agreed':'yes',
 
         #negative tags
-        'no':'no',
-        'nope':'no',
         'absolutely not':'no',
         'most certainly not':'no',
         'of course not':'no',
@@ -218,6 +427,25 @@ class oxycsbot(ChatBot):
 
     }
 
+    REQUIRED_TAGS = {
+        'waiting': ('hello',),
+        'thoughts_1': ('yes', 'no'),
+        'thoughts_2': ('yes', 'no'),
+        'increase_reason_1': ('yes', 'no'),
+        'increase_reason_2': ('yes', 'no'),
+        'unknown_benefit_1': ('yes',),
+        'unknown_benefit_2': ('yes',),
+    }
+
+    FINISH_RESPONSES = {
+        'confused': "I am sorry I do not understand what you are saying. Could we please get back to the topic at hand?",
+        'hello': "I am sorry I do not understand. Can you please say hello",
+        'success': 'Great, thank you so much!',
+        'fail': "I am sorry, I still do not understand what you are trying to say. Maybe we can discuss this again at a later point.",
+        'reject': "Ok, I understand. Thank you for your time.",
+        #'thanks': "You're welcome!",
+    }
+
 
     #BENEFITS = ['increase_salary',
     #            'more_paid_time_off',
@@ -325,27 +553,6 @@ class oxycsbot(ChatBot):
                 return self.finish('fail')
 
 
-
-        # "finish" functions
-
-    def finish_confused(self):
-        return "I am sorry I do not understand what you are saying. Could we please get back to the topic at hand?"
-
-    def finish_hello(self):
-        return "I am sorry I do not understand. Can you please say hello"
-
-    def finish_success(self):
-        return 'Great, thank you so much!'
-
-    def finish_fail(self):
-        return "I am sorry, I still do not understand what you are trying to say. Maybe we can discuss this again at a later point."
-
-    def finish_reject(self):
-        return "Ok, I understand. Thank you for your time."
-
-    #def finish_thanks(self):
-        #return "You're welcome!"
-
-
 if __name__ == '__main__':
+    print(sys.version)
     oxycsbot().chat()
@@ -0,0 +1,46 @@
+# cython: language_level=3
+"""A compiled version of `oxycsbot.count_tags`.
+
+Build it in place with `cythonize -i tagscan.pyx`. If the extension is not
+built, oxycsbot uses its pure Python version instead.
+"""
+
+# must match oxycsbot.TRIE_TAGS
+cdef str TRIE_TAGS = ''
+
+
+cpdef list count_tags(list words, dict trie, Py_ssize_t num_tags):
+    """Count the tags of the phrases in a list of words.
+
+    Arguments:
+        words (List[str]): The lowercased words of the message.
+        trie (Dict[str, dict]): The phrases to look for.
+        num_tags (int): The number of distinct tag IDs.
+
+    Returns:
+        List[int]: A count of each tag found in the words, by tag ID.
+    """
+    cdef Py_ssize_t n = len(words)
+    cdef Py_ssize_t i = 0
+    cdef Py_ssize_t j
+    cdef Py_ssize_t length
+    cdef list counter = [0] * num_tags
+    cdef dict node
+    cdef object tags
+    cdef Py_ssize_t tag_id
+    while i < n:
+        node = trie
+        tags = None
+        length = 1
+        j = i
+        while j < n and words[j] in node:
+            node = node[words[j]]
+            j += 1
+            if TRIE_TAGS in node:
+                tags = node[TRIE_TAGS]
+                length = j - i
+        if tags is not None:
+            for tag_id in tags:
+                counter[tag_id] += 1
+        i += length
+    return counter
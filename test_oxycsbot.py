@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Tests for the tag matching in oxycsbot."""
+
+import contextlib
+import io
+import random
+import unittest
+
+import oxycsbot as oxycsbot_module
+from oxycsbot import ChatBot, oxycsbot
+
+try:
+    import tagscan
+except ImportError:
+    tagscan = None
+
+
+def random_messages(count, seed=0):
+    """Generate messages made of words from oxycsbot's TAGS.
+    Arguments:
+        count (int): The number of messages.
+        seed (int): The random seed.
+    Returns:
+        List[str]: The messages.
+    """
+    rng = random.Random(seed)
+    words = sorted(set(word for phrase in oxycsbot.TAGS for word in phrase.split()))
+    words += ['well', 'maybe', 'the']
+    return [
+        ' '.join(rng.choice(words) for _ in range(rng.randint(1, 6)))
+        for _ in range(count)
+    ]
+
+
+class TestTags(unittest.TestCase):
+
+    def assertTagged(self, message, tag, state=None):
+        """Check that a message is tagged with a tag in a state."""
+        _, tags = oxycsbot._find_tags(message.lower(), state)
+        self.assertIn(tag, tags, message)
+
+    def test_quoted_words(self):
+        self.assertTagged("'yes'", 'yes')
+        self.assertTagged("yes'", 'yes')
+        self.assertTagged("I'd say 'no'", 'no')
+        self.assertTagged("what'sup", 'hello')
+
+    def test_quoted_answer_changes_state(self):
+        bot = oxycsbot()
+        bot.respond('hello')
+        bot.respond("I'd say 'no'")
+        self.assertEqual(bot.state, 'thoughts_2')
+
+
+    def test_required_tags_match_full_tags(self):
+        # the narrowed phrases of each state must count its required tags
+        # exactly as all of TAGS would
+        for message in random_messages(5000):
+            full, _ = oxycsbot._find_tags(message, None)
+            for state, required in oxycsbot.REQUIRED_TAGS.items():
+                narrowed, _ = oxycsbot._find_tags(message, state)
+                for tag in required:
+                    tag_id = oxycsbot._tag_names.index(tag)
+                    self.assertEqual(narrowed[tag_id], full[tag_id], (state, message))
+
+    @unittest.skipIf(tagscan is None, 'tagscan extension is not built')
+    def test_compiled_count_tags(self):
+        trie = oxycsbot._build_tag_trie(oxycsbot.TAGS)
+        num_tags = len(oxycsbot._tag_names)
+        for message in random_messages(5000, seed=1):
+            words = oxycsbot_module.TOKEN_RE.findall(message)
+            self.assertEqual(
+                tagscan.count_tags(words, trie, num_tags),
+                oxycsbot_module._count_tags_py(words, trie, num_tags),
+                message,
+            )
+
+
+class TestStates(unittest.TestCase):
+
+    def test_go_to_undefined_state(self):
+        bot = oxycsbot()
+        for state in ('thoughts_3', True, -1, len(bot.STATES)):
+            with self.assertRaises(KeyError):
+                bot.go_to_state(state)
+        self.assertEqual(bot.state, 'waiting')
+
+    def test_go_to_default_state(self):
+        bot = oxycsbot()
+        with self.assertRaises(ValueError):
+            bot.go_to_state('waiting')
+
+    def test_missing_state_methods(self):
+
+        class TwoStateBot(ChatBot):
+            STATES = ['start', 'end']
+
+            def __init__(self):
+                super().__init__(default_state='start')
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            bot = TwoStateBot()
+        with self.assertRaisesRegex(AttributeError, 'respond_from_start'):
+            bot.respond('hello')
+        with self.assertRaisesRegex(AttributeError, 'on_enter_end'):
+            bot.go_to_state('end')
+
+    def test_go_to_state_id(self):
+        bot = oxycsbot()
+        bot.go_to_state(bot.STATES.index('thoughts_2'))
+        self.assertEqual(bot.state, 'thoughts_2')
+
+
+
+class TestFinish(unittest.TestCase):
+
+    def test_finish_response(self):
+        bot = oxycsbot()
+        self.assertEqual(bot.finish('success'), oxycsbot.FINISH_RESPONSES['success'])
+
+    def test_finish_method_overrides_response(self):
+
+        class PoliteBot(oxycsbot):
+            def finish_success(self):
+                return 'Much appreciated!'
+
+        bot = PoliteBot()
+        bot.go_to_state('increase_reason_1')
+        self.assertEqual(bot.respond('yes'), 'Much appreciated!')
+        self.assertEqual(bot.state, 'waiting')
+
+    def test_undefined_manner(self):
+        with self.assertRaises(AttributeError):
+            oxycsbot().finish('thanks')
+
+
+if __name__ == '__main__':
+    unittest.main()